@@ -0,0 +1,120 @@
+import io
+import os
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+import logging
+import fitz
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# CPUs this process may actually run on (affinity/cpusets), not the host total
+_USABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+# Each worker is a full interpreter with PyMuPDF loaded, and every uvicorn worker has its own pool
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(_USABLE_CPUS, 4)))
+PARALLEL_PDF_MIN_PAGES = 16  # below this, process start-up and data hand-off cost more than they save
+# PyMuPDF's default "text" flags, but with ligatures (ﬁ, ﬂ, …) expanded to plain letters
+# so words embed and match the same as when typed
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # The server process is multi-threaded (uvicorn, ONNX Runtime, to_thread workers),
+            # so fork could deadlock the children; spawn starts them clean.
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next large PDF starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool() -> None:
+    """Stop the PDF worker processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def _join_pages(doc: "fitz.Document", start: int, stop: int) -> str:
+    return "\n".join(doc[i].get_text("text", flags=TEXT_FLAGS) for i in range(start, stop))
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> str:
+    """Extract pages ``[start, stop)``. Runs in a worker process with its own document handle."""
+    with fitz.open(path) as doc:
+        return _join_pages(doc, start, stop)
+
+
+def _extract_parallel(data: bytes, page_count: int) -> str:
+    """Extract page ranges in worker processes, handing them the PDF once via a temp file."""
+    step = -(-page_count // PDF_WORKERS)
+    bounds = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        pool = _get_pool()
+        try:
+            futures = [pool.submit(_extract_page_range, path, start, stop) for start, stop in bounds]
+            return "\n".join(f.result() for f in futures)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+    finally:
+        os.remove(path)
+
+
+def extract_pdf_text(data: bytes) -> str:
+    """Extract text from PDF bytes with PyMuPDF, falling back to pypdf if MuPDF rejects them.
+
+    Large PDFs are split into contiguous page ranges extracted in parallel. MuPDF
+    is not thread-safe, so this uses worker processes rather than threads.
+    """
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            page_count = doc.page_count
+            if page_count < PARALLEL_PDF_MIN_PAGES or PDF_WORKERS < 2:
+                return _join_pages(doc, 0, page_count)
+
+        try:
+            return _extract_parallel(data, page_count)
+        except BrokenProcessPool as e:
+            logger.warning(f"PDF worker pool failed, extracting serially: {e}")
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                return _join_pages(doc, 0, page_count)
+    except Exception as e:
+        logger.warning(f"PyMuPDF could not read PDF, falling back to pypdf: {e}")
+
+    reader = PdfReader(io.BytesIO(data))
+    return "".join(
+        page_text + "\n"
+        for page_text in (page.extract_text() for page in reader.pages)
+        if page_text
+    )
+
+
+def extract_text(data: bytes, filename: str) -> str:
+    """Decode the text content of an uploaded file."""
+    if filename.lower().endswith(".pdf"):
+        return extract_pdf_text(data)
+    return data.decode("utf-8", errors="ignore")
@@ -1,17 +1,18 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Any, Iterator
 from contextlib import asynccontextmanager
 import uvicorn
-import shutil
-import os
+import asyncio
 import time
 import uuid
+import orjson
 import logging
-from pypdf import PdfReader
 from backend.rag import RAGService
+from backend.extraction import extract_text, shutdown_pool
+from backend.store import Store
 
 # -------------------------------------------------------------------
 # Logging
@@ -19,12 +20,13 @@ from backend.rag import RAGService
 logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s  %(message)s")
 logger = logging.getLogger(__name__)
 
+# Only this much of each document is ever sent for summarisation (~token limit)
+SUMMARY_TEXT_CHARS = 3000
+
 # -------------------------------------------------------------------
-# In-memory stores
+# Shared store (documents, conversations, analytics) – SQLite, so all workers agree
 # -------------------------------------------------------------------
-conversation_store: Dict[str, dict] = {}   # conv_id -> { id, title, messages[], created_at, updated_at }
-document_store: Dict[str, dict] = {}       # filename -> meta
-query_analytics: List[dict] = []           # [{query, mode, timestamp, response_time_ms}]
+store = Store()
 
 # -------------------------------------------------------------------
 # Lifespan
@@ -40,6 +42,7 @@ async def lifespan(app: FastAPI):
         app.state.rag_service = None
     yield
     logger.info("Shutting down…")
+    shutdown_pool()
 
 
 app = FastAPI(
@@ -47,6 +50,7 @@ app = FastAPI(
     description="A smart document assistant powered by Endee Vector DB, Sentence-Transformers & Gemini.",
     version="3.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -71,9 +75,8 @@ def get_rag_service(request: Request) -> RAGService:
     return request.app.state.rag_service
 
 
-def smart_chunk(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
-    """Sliding-window chunker that respects sentence boundaries."""
-    sentences = []
+def _iter_sentences(text: str) -> Iterator[str]:
+    """Yield non-empty sentences paragraph by paragraph, splitting on ". "."""
     for para in text.split("\n"):
         para = para.strip()
         if not para:
@@ -81,20 +84,40 @@ def smart_chunk(text: str, chunk_size: int = 500, overlap: int = 100) -> List[st
         for sent in para.replace(". ", ".\n").split("\n"):
             sent = sent.strip()
             if sent:
-                sentences.append(sent)
+                yield sent
+
+
+def smart_chunk(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
+    """Sliding-window chunker that respects sentence boundaries."""
+    sentences = _iter_sentences(text)
 
     chunks: List[str] = []
-    current_chunk = ""
+    cur_parts: List[str] = []
+    cur_len = 0  # length of " ".join(cur_parts) plus one trailing separator
     for sent in sentences:
-        if len(current_chunk) + len(sent) + 1 > chunk_size and current_chunk:
-            chunks.append(current_chunk.strip())
-            words = current_chunk.split()
-            overlap_words = words[-min(len(words), overlap // 5):]
-            current_chunk = " ".join(overlap_words) + " " + sent
-        else:
-            current_chunk += " " + sent
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+        if cur_parts and cur_len + len(sent) > chunk_size:
+            chunks.append(" ".join(cur_parts))
+
+            # Carry trailing sentences that fit the overlap budget into the next chunk
+            tail: List[str] = []
+            tail_len = 0
+            for part in reversed(cur_parts):
+                if tail_len + len(part) + 1 > overlap:
+                    break
+                tail.append(part)
+                tail_len += len(part) + 1
+            if not tail:
+                # Last sentence alone exceeds the budget – fall back to its trailing words
+                words = cur_parts[-1].split()
+                part = " ".join(words[-min(len(words), overlap // 5):])
+                tail, tail_len = [part], len(part) + 1
+            tail.reverse()
+            cur_parts, cur_len = tail, tail_len
+
+        cur_parts.append(sent)
+        cur_len += len(sent) + 1
+    if cur_parts:
+        chunks.append(" ".join(cur_parts))
     return chunks
 
 
@@ -106,6 +129,57 @@ def generate_title_from_query(query: str) -> str:
     return title
 
 
+def format_search_results(results: list) -> tuple[List[dict], List[str]]:
+    """Turn raw Endee hits into API results plus the context chunks for the LLM."""
+    formatted_results = []
+    context_chunks = []
+
+    for item in results:
+        content = item.get("meta", {}).get("content", "No content available")
+        if content and content != "No content available":
+            context_chunks.append(content)
+
+        formatted_results.append({
+            "id": item.get("id"),
+            "score": item.get("similarity"),
+            "content": content,
+            "filename": item.get("meta", {}).get("filename", "unknown"),
+        })
+    return formatted_results, context_chunks
+
+
+def conversation_history(conv_id: Optional[str]) -> List[dict]:
+    """Recent messages of a conversation, used as context for follow-up questions."""
+    if conv_id:
+        return store.recent_messages(conv_id, limit=6)
+    return []
+
+
+def save_exchange(conv_id: Optional[str], query: str, answer: str) -> str:
+    """Append a question/answer pair, creating the conversation if needed. Returns its id."""
+    if conv_id is None or not store.has_conversation(conv_id):
+        conv_id = str(uuid.uuid4())
+    store.append_exchange(conv_id, generate_title_from_query(query), query, answer)
+    return conv_id
+
+
+def record_query(query: str, mode: str, start_time: float, results_count: int) -> None:
+    """Track analytics for a served query."""
+    elapsed = int((time.time() - start_time) * 1000)
+    store.record_query({
+        "query": query,
+        "mode": mode,
+        "timestamp": time.time(),
+        "response_time_ms": elapsed,
+        "results_count": results_count,
+    })
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """Encode a single Server-Sent Event with a JSON payload."""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
 # -------------------------------------------------------------------
 # Models
 # -------------------------------------------------------------------
@@ -170,20 +244,20 @@ def health_check(request: Request):
         "status": "healthy" if rag_ok else "degraded",
         "endee_connected": rag_ok,
         "gemini_enabled": gemini_ok,
-        "documents_loaded": len(document_store),
-        "active_conversations": len(conversation_store),
+        "documents_loaded": store.document_stats()[0],
+        "active_conversations": store.conversation_count(),
     }
 
 
 @app.get("/stats", response_model=StatsResponse)
 def get_stats(request: Request):
     rag = request.app.state.rag_service
-    total_chunks = sum(d.get("chunks", 0) for d in document_store.values())
+    total_documents, total_chunks = store.document_stats()
     return StatsResponse(
-        total_documents=len(document_store),
+        total_documents=total_documents,
         total_chunks=total_chunks,
-        total_conversations=len(conversation_store),
-        total_queries=len(query_analytics),
+        total_conversations=store.conversation_count(),
+        total_queries=store.analytics_totals()[0],
         endee_connected=rag is not None,
         gemini_enabled=rag is not None and getattr(rag, "has_gemini", False),
     )
@@ -201,14 +275,13 @@ def list_documents():
             size_bytes=meta["size_bytes"],
             uploaded_at=meta["uploaded_at"],
         )
-        for meta in document_store.values()
+        for meta in store.list_documents()
     ]
 
 
 @app.delete("/documents/{filename}")
 def delete_document(filename: str):
-    if filename in document_store:
-        del document_store[filename]
+    if store.delete_document(filename):
         return {"status": "deleted", "filename": filename}
     raise HTTPException(status_code=404, detail="Document not found")
 
@@ -216,44 +289,32 @@ def delete_document(filename: str):
 @app.post("/ingest")
 async def ingest_file(request: Request, file: UploadFile = File(...)):
     service = get_rag_service(request)
-    temp_file = f"temp_{file.filename}"
-    with open(temp_file, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    file_size = os.path.getsize(temp_file)
-
     try:
-        text_content = ""
-        if file.filename.lower().endswith(".pdf"):
-            reader = PdfReader(temp_file)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_content += page_text + "\n"
-        else:
-            with open(temp_file, "r", encoding="utf-8", errors="ignore") as f:
-                text_content = f.read()
+        data = await file.read()
+        file_size = len(data)
+
+        # Parsing, chunking and embedding are CPU-bound; keep them off the event loop.
+        text_content = await asyncio.to_thread(extract_text, data, file.filename)
 
         if not text_content.strip():
             raise HTTPException(status_code=400, detail="Could not extract any text from the file.")
 
-        chunks = smart_chunk(text_content)
+        chunks = await asyncio.to_thread(smart_chunk, text_content)
 
-        count = 0
-        for chunk in chunks:
-            service.ingest_text(chunk, meta={"filename": file.filename, "content": chunk})
-            count += 1
+        items = ((c, {"filename": file.filename, "content": c}) for c in chunks)
+        ids = await asyncio.to_thread(service.ingest_texts, items)
+        count = len(ids)
 
         # Store metadata with text preview
         preview = text_content[:300].strip()
-        document_store[file.filename] = {
+        await asyncio.to_thread(store.put_document, {
             "filename": file.filename,
             "chunks": count,
             "size_bytes": file_size,
             "uploaded_at": time.time(),
             "preview": preview,
-            "full_text": text_content,
-        }
+            "summary_text": text_content[:SUMMARY_TEXT_CHARS],
+        })
 
         logger.info(f"Ingested '{file.filename}': {count} chunks, {file_size} bytes")
         return {
@@ -269,24 +330,19 @@ async def ingest_file(request: Request, file: UploadFile = File(...)):
     except Exception as e:
         logger.exception("Ingestion error")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
 
 
 @app.post("/summarize")
 async def summarize_document(request: Request, body: SummarizeRequest):
     """Generate an AI summary of an indexed document."""
     service = get_rag_service(request)
-    if body.filename not in document_store:
+    doc = await asyncio.to_thread(store.get_document, body.filename)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    doc = document_store[body.filename]
-    full_text = doc.get("full_text", doc.get("preview", ""))
-    # Truncate to ~3000 chars to stay within token limits
-    truncated = full_text[:3000]
+    summary_text = doc.get("summary_text", doc.get("preview", ""))
 
-    summary = service.summarize_text(truncated, body.filename)
+    summary = await asyncio.to_thread(service.summarize_text, summary_text, body.filename)
     return {"filename": body.filename, "summary": summary}
 
 
@@ -298,86 +354,74 @@ async def query_index(request: Request, query_data: QueryRequest):
     service = get_rag_service(request)
     start_time = time.time()
 
-    results = service.search(query_data.query, top_k=query_data.top_k)
-
-    formatted_results = []
-    context_chunks = []
-
-    for item in results:
-        content = item.get("meta", {}).get("content", "No content available")
-        if content and content != "No content available":
-            context_chunks.append(content)
-
-        formatted_results.append({
-            "id": item.get("id"),
-            "score": item.get("similarity"),
-            "content": content,
-            "filename": item.get("meta", {}).get("filename", "unknown"),
-        })
+    results = await asyncio.to_thread(service.search, query_data.query, query_data.top_k)
+    formatted_results, context_chunks = format_search_results(results)
 
     answer = None
     conv_id = query_data.conversation_id
 
     if query_data.mode == "chat":
-        history = []
-        if conv_id and conv_id in conversation_store:
-            history = conversation_store[conv_id]["messages"][-6:]
-
-        answer = service.generate_answer(query_data.query, context_chunks, history=history)
-
-        # Manage conversation
-        if conv_id is None or conv_id not in conversation_store:
-            conv_id = str(uuid.uuid4())
-            conversation_store[conv_id] = {
-                "id": conv_id,
-                "title": generate_title_from_query(query_data.query),
-                "messages": [],
-                "created_at": time.time(),
-                "updated_at": time.time(),
-            }
-
-        conversation_store[conv_id]["messages"].append({"role": "user", "content": query_data.query})
-        conversation_store[conv_id]["messages"].append({"role": "assistant", "content": answer})
-        conversation_store[conv_id]["updated_at"] = time.time()
-
-    # Track analytics
-    elapsed = int((time.time() - start_time) * 1000)
-    query_analytics.append({
-        "query": query_data.query,
-        "mode": query_data.mode,
-        "timestamp": time.time(),
-        "response_time_ms": elapsed,
-        "results_count": len(formatted_results),
-    })
+        history = await asyncio.to_thread(conversation_history, conv_id)
+        answer = await asyncio.to_thread(service.generate_answer, query_data.query, context_chunks, history)
+        conv_id = await asyncio.to_thread(save_exchange, conv_id, query_data.query, answer)
+
+    await asyncio.to_thread(record_query, query_data.query, query_data.mode, start_time, len(formatted_results))
 
     return QueryResponse(results=formatted_results, answer=answer, conversation_id=conv_id)
 
 
+@app.post("/query/stream")
+async def query_index_stream(request: Request, query_data: QueryRequest):
+    """Chat query streamed as Server-Sent Events.
+
+    Emits one ``results`` event with the retrieved chunks, ``token`` events as the
+    answer is generated, and a final ``done`` event carrying the conversation id.
+    If generation fails part-way, an ``error`` event is sent instead of ``done`` and
+    the truncated answer is not saved to the conversation.
+    """
+    service = get_rag_service(request)
+    start_time = time.time()
+
+    results = await asyncio.to_thread(service.search, query_data.query, query_data.top_k)
+    formatted_results, context_chunks = format_search_results(results)
+    history = await asyncio.to_thread(conversation_history, query_data.conversation_id)
+
+    def event_stream():
+        # Sync generator: Starlette iterates it in a worker thread
+        yield sse_event("results", formatted_results)
+
+        parts: List[str] = []
+        try:
+            for text in service.generate_answer_stream(query_data.query, context_chunks, history):
+                parts.append(text)
+                yield sse_event("token", text)
+        except Exception as e:
+            record_query(query_data.query, "chat", start_time, len(formatted_results))
+            yield sse_event("error", {"detail": f"Answer generation was interrupted: {e}"})
+            return
+
+        conv_id = save_exchange(query_data.conversation_id, query_data.query, "".join(parts))
+        record_query(query_data.query, "chat", start_time, len(formatted_results))
+        yield sse_event("done", {"conversation_id": conv_id})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 # -------------------------------------------------------------------
 # Conversation Endpoints
 # -------------------------------------------------------------------
 @app.get("/conversations", response_model=List[ConversationSummary])
 def list_conversations():
     """List all conversations sorted by most recent."""
-    convos = sorted(conversation_store.values(), key=lambda c: c["updated_at"], reverse=True)
-    return [
-        ConversationSummary(
-            id=c["id"],
-            title=c["title"],
-            message_count=len(c["messages"]),
-            created_at=c["created_at"],
-            updated_at=c["updated_at"],
-        )
-        for c in convos
-    ]
+    return [ConversationSummary(**c) for c in store.list_conversations()]
 
 
 @app.get("/conversations/{conv_id}", response_model=ConversationDetail)
 def get_conversation(conv_id: str):
     """Get full conversation detail."""
-    if conv_id not in conversation_store:
+    c = store.get_conversation(conv_id)
+    if c is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    c = conversation_store[conv_id]
     return ConversationDetail(
         id=c["id"],
         title=c["title"],
@@ -389,16 +433,14 @@ def get_conversation(conv_id: str):
 
 @app.put("/conversations/{conv_id}/rename")
 def rename_conversation(conv_id: str, body: RenameRequest):
-    if conv_id not in conversation_store:
+    if not store.rename_conversation(conv_id, body.title):
         raise HTTPException(status_code=404, detail="Conversation not found")
-    conversation_store[conv_id]["title"] = body.title
     return {"status": "renamed", "id": conv_id, "title": body.title}
 
 
 @app.delete("/conversations/{conv_id}")
 def delete_conversation(conv_id: str):
-    if conv_id in conversation_store:
-        del conversation_store[conv_id]
+    if store.delete_conversation(conv_id):
         return {"status": "deleted", "id": conv_id}
     raise HTTPException(status_code=404, detail="Conversation not found")
 
@@ -406,17 +448,13 @@ def delete_conversation(conv_id: str):
 @app.get("/conversations/{conv_id}/export", response_class=PlainTextResponse)
 def export_conversation(conv_id: str):
     """Export a conversation as Markdown."""
-    if conv_id not in conversation_store:
+    exported = store.get_conversation_markdown(conv_id)
+    if exported is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    c = conversation_store[conv_id]
-    lines = [f"# {c['title']}\n", f"*Exported from Endee RAG Assistant*\n\n---\n"]
-
-    for msg in c["messages"]:
-        role = "**You**" if msg["role"] == "user" else "**Endee Assistant**"
-        lines.append(f"{role}:\n\n{msg['content']}\n\n---\n")
-
-    return "\n".join(lines)
+    # Message blocks are rendered as they are appended; only the header depends on the (renamable) title
+    title, body = exported
+    return f"# {title}\n\n*Exported from Endee RAG Assistant*\n\n---\n{body}"
 
 
 # -------------------------------------------------------------------
@@ -425,13 +463,14 @@ def export_conversation(conv_id: str):
 @app.get("/analytics")
 def get_analytics():
     """Query analytics summary."""
-    if not query_analytics:
+    total, total_ms = store.analytics_totals()
+    if not total:
         return {"total_queries": 0, "avg_response_ms": 0, "recent": []}
 
-    avg = sum(q["response_time_ms"] for q in query_analytics) / len(query_analytics)
-    recent = query_analytics[-10:][::-1]
+    avg = total_ms / total
+    recent = store.recent_queries(10)
     return {
-        "total_queries": len(query_analytics),
+        "total_queries": total,
         "avg_response_ms": round(avg),
         "recent": recent,
     }
@@ -1,6 +1,13 @@
 import os
 import time
-from typing import List, Dict, Any, Optional
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+from itertools import islice
+import numpy as np
 from endee import Endee, Precision
 from sentence_transformers import SentenceTransformer
 import uuid
@@ -15,20 +22,57 @@ logger = logging.getLogger(__name__)
 # Configuration
 ENDEE_URL = os.getenv("ENDEE_URL", "http://localhost:8081")
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "onnx" runs the int8-quantised export shipped with the model via ONNX Runtime; "torch" uses PyTorch.
+# Left unset, ONNX is tried first and PyTorch used if ONNX Runtime is missing; set explicitly, it must load.
+EMBEDDING_BACKEND_ENV = (os.getenv("EMBEDDING_BACKEND") or "").strip().lower() or None
+EMBEDDING_BACKEND = EMBEDDING_BACKEND_ENV or "onnx"
+if EMBEDDING_BACKEND not in ("onnx", "torch"):
+    raise ValueError(f"EMBEDDING_BACKEND must be 'onnx' or 'torch', got {os.getenv('EMBEDDING_BACKEND')!r}")
+# The AVX2 (quint8) export is portable; the AVX-512 VNNI one can lose accuracy on AVX2-only CPUs
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
 INDEX_NAME = "documents"
 VECTOR_DIMENSION = 384
+ENCODE_BATCH_SIZE = 64
+QUERY_BATCH_SIZE = 32
+UPSERT_BATCH_SIZE = 256
+QUERY_CACHE_SIZE = 1024
+EMBED_CACHE_SIZE = 50_000  # float32 vectors, ~1.5 KB each
+GEMINI_ATTEMPTS_PER_MODEL = 2
+GEMINI_BACKOFF_SECONDS = 1.0
+
+GEMINI_MISSING_KEY_MESSAGE = "Gemini API Key is missing. Please set GEMINI_API_KEY to enable AI chat."
+GEMINI_EXHAUSTED_MESSAGE = (
+    "⚠️ All Gemini models are currently rate-limited. "
+    "Please wait a minute and try again, or check your API quota at "
+    "[ai.google.dev](https://ai.google.dev/gemini-api/docs/rate-limits)."
+)
 
 
 class RAGService:
+    # Static parts of the answer prompt; the dynamic sections are joined in between
+    _ANSWER_PROMPT_HEAD = (
+        "You are Endee Assistant — a knowledgeable, friendly AI document assistant.\n"
+        "Use the retrieved context below to answer the user's question accurately.\n"
+        "If the answer is not in the context, say so clearly but remain helpful.\n"
+        "Format your answer in Markdown for readability (use headers, bullet points, bold, etc.).\n"
+        "\n"
+    )
+    _ANSWER_PROMPT_TAIL = "\n\nAnswer (in Markdown):"
+
     def __init__(self):
         # Endee client
         self.endee = Endee()
         base_url = f"{ENDEE_URL}/api/v1"
+        # The client keeps its own pooled requests.Session, so connections are reused across calls
         self.endee.set_base_url(base_url)
 
         # Embedding model
-        logger.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME}")
-        self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        self.model = self._load_embedding_model()
+        # Per-instance cache so repeated queries skip the forward pass
+        self._embed_query = functools.lru_cache(maxsize=QUERY_CACHE_SIZE)(self._encode_query)
+        # Content-hash -> embedding, so re-ingested chunks skip the forward pass
+        self._embed_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._embed_cache_lock = threading.Lock()
 
         # Gemini LLM – multiple models to fallback through on quota errors
         self.api_key = os.getenv("GEMINI_API_KEY")
@@ -43,13 +87,44 @@ class RAGService:
             logger.info("Gemini API Key found – Chat mode enabled.")
             genai.configure(api_key=self.api_key)
             self.has_gemini = True
+            self._gemini_models = {name: genai.GenerativeModel(name) for name in self.GEMINI_MODEL_CHAIN}
         else:
             logger.warning("Gemini API Key NOT found – Chat mode disabled.")
             self.has_gemini = False
+            self._gemini_models = {}
 
         # Ensure vector index
         self._ensure_index()
 
+    # ------------------------------------------------------------------
+    # Embedding model
+    # ------------------------------------------------------------------
+    def _load_embedding_model(self) -> SentenceTransformer:
+        """Load MiniLM on ONNX Runtime (int8) when available, else on PyTorch.
+
+        Both backends produce 384-dim sentence embeddings, but the int8 model's vectors
+        differ slightly from PyTorch's, so all workers sharing an index should use the same one.
+        """
+        if EMBEDDING_BACKEND == "onnx":
+            try:
+                logger.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME} (ONNX, {EMBEDDING_ONNX_FILE})")
+                return SentenceTransformer(
+                    EMBEDDING_MODEL_NAME,
+                    backend="onnx",
+                    model_kwargs={"file_name": EMBEDDING_ONNX_FILE, "provider": "CPUExecutionProvider"},
+                )
+            except Exception as e:
+                if EMBEDDING_BACKEND_ENV == "onnx":
+                    raise RuntimeError(f"EMBEDDING_BACKEND=onnx but the ONNX model could not be loaded: {e}") from e
+                logger.error(
+                    f"ONNX embedding backend unavailable, falling back to PyTorch: {e}. "
+                    "Workers on different backends will embed into the same index inconsistently; "
+                    "set EMBEDDING_BACKEND explicitly to pin one."
+                )
+
+        logger.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME}")
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
     # ------------------------------------------------------------------
     # Index management
     # ------------------------------------------------------------------
@@ -76,105 +151,206 @@ class RAGService:
     # ------------------------------------------------------------------
     def ingest_text(self, text: str, meta: Dict[str, Any] | None = None) -> Optional[str]:
         """Embed *text* and upsert into Endee."""
-        if not text.strip():
-            return None
-
-        vector = self.model.encode(text).tolist()
-        doc_id = str(uuid.uuid4())
-
-        record = {
-            "id": doc_id,
-            "vector": vector,
-            "meta": meta or {},
-        }
-
-        if hasattr(self, "index"):
-            self.index.upsert([record])
-            logger.debug(f"Ingested chunk {doc_id}")
-            return doc_id
-        else:
+        ids = self.ingest_texts([(text, meta or {})])
+        return ids[0] if ids else None
+
+    def _embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """Normalised embeddings for *texts*, encoding only those not already cached."""
+        keys = [hashlib.blake2b(t.encode(), digest_size=16).digest() for t in texts]
+        with self._embed_cache_lock:
+            vectors = [self._embed_cache.get(k) for k in keys]
+
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            encoded = self.model.encode(
+                [texts[i] for i in missing],
+                batch_size=ENCODE_BATCH_SIZE,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            for i, v in zip(missing, encoded):
+                vectors[i] = v
+
+        with self._embed_cache_lock:
+            for k, v in zip(keys, vectors):
+                self._embed_cache[k] = v
+                self._embed_cache.move_to_end(k)
+            while len(self._embed_cache) > EMBED_CACHE_SIZE:
+                self._embed_cache.popitem(last=False)
+        return vectors
+
+    def ingest_texts(self, items: Iterable[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """Embed ``(text, meta)`` pairs in batches and upsert them into Endee.
+
+        *items* is consumed lazily, one upsert batch at a time, so only a single
+        batch of records is materialised alongside the caller's data.
+        """
+        if not hasattr(self, "index"):
             logger.error("Index not initialised – cannot ingest.")
-            return None
+            return []
+
+        ids: List[str] = []
+        pairs = ((t, m) for t, m in items if t.strip())
+        while batch := list(islice(pairs, UPSERT_BATCH_SIZE)):
+            vectors = self._embed_texts([t for t, _ in batch])
+            records = [
+                {"id": str(uuid.uuid4()), "vector": v.tolist(), "meta": m or {}}
+                for v, (_, m) in zip(vectors, batch)
+            ]
+            self.index.upsert(records)
+            ids.extend(r["id"] for r in records)
+
+        logger.debug(f"Ingested {len(ids)} chunks")
+        return ids
 
     # ------------------------------------------------------------------
     # Search
     # ------------------------------------------------------------------
+    def _encode_query(self, query: str) -> tuple:
+        return tuple(self.model.encode(query, normalize_embeddings=True).tolist())
+
     def search(self, query: str, top_k: int = 5) -> list:
         if not hasattr(self, "index"):
             return []
 
-        query_vector = self.model.encode(query).tolist()
+        query_vector = list(self._embed_query(query))
         results = self.index.query(vector=query_vector, top_k=top_k)
         return results
 
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[list]:
+        """Search several queries at once, e.g. for multi-query or rewritten retrieval.
+
+        Returns one result list per query, in the same order.
+        """
+        if not hasattr(self, "index") or not queries:
+            return [[] for _ in queries]
+
+        vectors = self.model.encode(
+            queries,
+            batch_size=QUERY_BATCH_SIZE,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).tolist()
+
+        # Endee has no batched query endpoint – overlap the per-query round trips instead
+        with ThreadPoolExecutor(max_workers=min(len(vectors), 8)) as pool:
+            return list(pool.map(lambda v: self.index.query(vector=v, top_k=top_k), vectors))
+
     # ------------------------------------------------------------------
     # Gemini caller with model fallback
     # ------------------------------------------------------------------
+    def _retry_after_gemini_error(self, model_name: str, attempt: int, error: Exception) -> bool:
+        """Log a failed Gemini call; back off and return True if it is worth retrying.
+
+        Rate-limit / quota errors are retried on the same model after an exponential
+        backoff; anything else moves on to the next model in the chain. There is no
+        backoff after a model's last attempt, since the next model has its own quota.
+        """
+        err_str = str(error).lower()
+        if "429" in err_str or "quota" in err_str or "rate" in err_str:
+            logger.warning(f"{model_name} attempt {attempt+1} hit rate limit, trying next…")
+            if attempt + 1 < GEMINI_ATTEMPTS_PER_MODEL:
+                # Runs in a worker thread (see backend.main), so sleeping doesn't block the event loop
+                time.sleep(GEMINI_BACKOFF_SECONDS * 2 ** attempt)
+            return True
+        logger.exception(f"Gemini error with {model_name}")
+        return False
+
     def _call_gemini(self, prompt: str) -> str:
         """Try each model in the fallback chain until one succeeds."""
         if not self.has_gemini:
-            return "Gemini API Key is missing. Please set GEMINI_API_KEY to enable AI chat."
+            return GEMINI_MISSING_KEY_MESSAGE
 
         last_error = None
         for model_name in self.GEMINI_MODEL_CHAIN:
-            for attempt in range(2):
+            for attempt in range(GEMINI_ATTEMPTS_PER_MODEL):
                 try:
-                    model = genai.GenerativeModel(model_name)
+                    model = self._gemini_models[model_name]
                     response = model.generate_content(prompt)
                     return response.text
                 except Exception as e:
                     last_error = e
-                    err_str = str(e)
-                    if "429" in err_str or "quota" in err_str.lower() or "rate" in err_str.lower():
-                        logger.warning(f"{model_name} attempt {attempt+1} hit rate limit, trying next…")
-                        time.sleep(2)
+                    if self._retry_after_gemini_error(model_name, attempt, e):
                         continue
-                    else:
-                        logger.exception(f"Gemini error with {model_name}")
-                        break
+                    break
 
         logger.error(f"All Gemini models exhausted. Last error: {last_error}")
-        return (
-            "⚠️ All Gemini models are currently rate-limited. "
-            "Please wait a minute and try again, or check your API quota at "
-            "[ai.google.dev](https://ai.google.dev/gemini-api/docs/rate-limits)."
-        )
+        return GEMINI_EXHAUSTED_MESSAGE
+
+    def _stream_gemini(self, prompt: str) -> Iterator[str]:
+        """Streaming variant of :meth:`_call_gemini`; falls back only before the first chunk.
+
+        If the stream fails after text has been yielded, the error is re-raised so the
+        caller can tell a truncated answer from a complete one.
+        """
+        if not self.has_gemini:
+            yield GEMINI_MISSING_KEY_MESSAGE
+            return
+
+        last_error = None
+        for model_name in self.GEMINI_MODEL_CHAIN:
+            for attempt in range(GEMINI_ATTEMPTS_PER_MODEL):
+                started = False
+                try:
+                    model = self._gemini_models[model_name]
+                    for chunk in model.generate_content(prompt, stream=True):
+                        if chunk.text:
+                            started = True
+                            yield chunk.text
+                    return
+                except Exception as e:
+                    if started:
+                        logger.exception(f"Gemini stream from {model_name} interrupted")
+                        raise
+                    last_error = e
+                    if self._retry_after_gemini_error(model_name, attempt, e):
+                        continue
+                    break
+
+        logger.error(f"All Gemini models exhausted. Last error: {last_error}")
+        yield GEMINI_EXHAUSTED_MESSAGE
 
     # ------------------------------------------------------------------
     # Answer generation
     # ------------------------------------------------------------------
-    def generate_answer(
+    def _build_answer_prompt(
         self,
         query: str,
         context_chunks: List[str],
         history: List[dict] | None = None,
     ) -> str:
-        """Generate an answer with Gemini, optionally using conversation history."""
         context_text = "\n\n".join(context_chunks) if context_chunks else "(no relevant documents found)"
 
-        history_block = ""
+        parts = [self._ANSWER_PROMPT_HEAD]
         if history:
-            history_block = "Previous conversation:\n"
-            for msg in history:
-                role = "User" if msg["role"] == "user" else "Assistant"
-                history_block += f"{role}: {msg['content']}\n"
-            history_block += "\n"
-
-        prompt = f"""You are Endee Assistant — a knowledgeable, friendly AI document assistant.
-Use the retrieved context below to answer the user's question accurately.
-If the answer is not in the context, say so clearly but remain helpful.
-Format your answer in Markdown for readability (use headers, bullet points, bold, etc.).
+            parts.append("Previous conversation:\n")
+            parts.extend(
+                f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}\n"
+                for msg in history
+            )
+            parts.append("\n")
+        parts += ["---\nRetrieved Context:\n", context_text, "\n\n---\nUser Question: ", query, self._ANSWER_PROMPT_TAIL]
+        return "".join(parts)
 
-{history_block}---
-Retrieved Context:
-{context_text}
-
----
-User Question: {query}
-
-Answer (in Markdown):"""
+    def generate_answer(
+        self,
+        query: str,
+        context_chunks: List[str],
+        history: List[dict] | None = None,
+    ) -> str:
+        """Generate an answer with Gemini, optionally using conversation history."""
+        return self._call_gemini(self._build_answer_prompt(query, context_chunks, history))
 
-        return self._call_gemini(prompt)
+    def generate_answer_stream(
+        self,
+        query: str,
+        context_chunks: List[str],
+        history: List[dict] | None = None,
+    ) -> Iterator[str]:
+        """Like :meth:`generate_answer`, but yield text chunks as Gemini produces them."""
+        yield from self._stream_gemini(self._build_answer_prompt(query, context_chunks, history))
 
     # ------------------------------------------------------------------
     # Document summarisation
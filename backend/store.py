@@ -0,0 +1,214 @@
+import os
+import orjson
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Dict, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STORE_PATH = os.getenv("STORE_PATH", "endee_rag.db")
+MAX_CONVERSATIONS = 1000
+MAX_ANALYTICS_ENTRIES = 10_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    filename TEXT PRIMARY KEY,
+    chunks   INTEGER NOT NULL,
+    data     BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id         TEXT PRIMARY KEY,
+    title      TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    markdown   TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    conv_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    role    TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_conv ON messages (conv_id, id);
+CREATE TABLE IF NOT EXISTS analytics (
+    id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analytics_totals (
+    id       INTEGER PRIMARY KEY CHECK (id = 0),
+    count    INTEGER NOT NULL,
+    total_ms INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO analytics_totals (id, count, total_ms) VALUES (0, 0, 0);
+"""
+
+
+def message_markdown(role: str, content: str) -> str:
+    """Markdown export block for one message, including its leading separator."""
+    speaker = "**You**" if role == "user" else "**Endee Assistant**"
+    return f"\n{speaker}:\n\n{content}\n\n---\n"
+
+
+class Store:
+    """Documents, conversations and query analytics shared by all uvicorn workers.
+
+    Backed by a single SQLite database in WAL mode, so every worker process on the
+    host sees the same state and readers never block the writer.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        logger.info(f"Store opened at '{path}'")
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        """Run a single write statement and return the number of affected rows."""
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    # ------------------------------------------------------------------
+    # Documents
+    # ------------------------------------------------------------------
+    def put_document(self, meta: Dict[str, Any]) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO documents (filename, chunks, data) VALUES (?, ?, ?)",
+            (meta["filename"], meta.get("chunks", 0), orjson.dumps(meta)),
+        )
+
+    def get_document(self, filename: str) -> Optional[dict]:
+        rows = self._query("SELECT data FROM documents WHERE filename = ?", (filename,))
+        return orjson.loads(rows[0]["data"]) if rows else None
+
+    def list_documents(self) -> List[dict]:
+        return [orjson.loads(r["data"]) for r in self._query("SELECT data FROM documents ORDER BY rowid")]
+
+    def delete_document(self, filename: str) -> bool:
+        return self._execute("DELETE FROM documents WHERE filename = ?", (filename,)) > 0
+
+    def document_stats(self) -> tuple[int, int]:
+        """Return ``(document_count, total_chunks)``."""
+        row = self._query("SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM documents")[0]
+        return row[0], row[1]
+
+    # ------------------------------------------------------------------
+    # Conversations
+    # ------------------------------------------------------------------
+    def conversation_count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM conversations")[0][0]
+
+    def has_conversation(self, conv_id: str) -> bool:
+        return bool(self._query("SELECT 1 FROM conversations WHERE id = ?", (conv_id,)))
+
+    def list_conversations(self) -> List[dict]:
+        """Conversation summaries, most recently updated first."""
+        rows = self._query(
+            "SELECT c.id, c.title, c.created_at, c.updated_at, "
+            "(SELECT COUNT(*) FROM messages m WHERE m.conv_id = c.id) AS message_count "
+            "FROM conversations c ORDER BY c.updated_at DESC"
+        )
+        return [dict(r) for r in rows]
+
+    def get_conversation(self, conv_id: str) -> Optional[dict]:
+        rows = self._query("SELECT id, title, created_at, updated_at FROM conversations WHERE id = ?", (conv_id,))
+        if not rows:
+            return None
+        conv = dict(rows[0])
+        conv["messages"] = self.recent_messages(conv_id)
+        return conv
+
+    def get_conversation_markdown(self, conv_id: str) -> Optional[tuple[str, str]]:
+        """Return ``(title, markdown)`` with the messages pre-rendered for export."""
+        rows = self._query("SELECT title, markdown FROM conversations WHERE id = ?", (conv_id,))
+        return (rows[0]["title"], rows[0]["markdown"]) if rows else None
+
+    def recent_messages(self, conv_id: str, limit: Optional[int] = None) -> List[dict]:
+        """Messages of a conversation in order; only the last *limit* if given."""
+        if limit is None:
+            rows = self._query("SELECT role, content FROM messages WHERE conv_id = ? ORDER BY id", (conv_id,))
+        else:
+            rows = self._query(
+                "SELECT role, content FROM (SELECT id, role, content FROM messages WHERE conv_id = ? "
+                "ORDER BY id DESC LIMIT ?) ORDER BY id",
+                (conv_id, limit),
+            )
+        return [dict(r) for r in rows]
+
+    def append_exchange(self, conv_id: str, title: str, query: str, answer: str) -> None:
+        """Append a question/answer pair, creating the conversation with *title* if new.
+
+        The least recently updated conversations are evicted past MAX_CONVERSATIONS.
+        """
+        now = time.time()
+        markdown = message_markdown("user", query) + message_markdown("assistant", answer)
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO conversations (id, title, created_at, updated_at, markdown) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at, "
+                    "markdown = markdown || excluded.markdown",
+                    (conv_id, title, now, now, markdown),
+                )
+                conn.executemany(
+                    "INSERT INTO messages (conv_id, role, content) VALUES (?, ?, ?)",
+                    [(conv_id, "user", query), (conv_id, "assistant", answer)],
+                )
+                conn.execute(
+                    "DELETE FROM conversations WHERE id IN (SELECT id FROM conversations "
+                    "ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (MAX_CONVERSATIONS,),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def rename_conversation(self, conv_id: str, title: str) -> bool:
+        return self._execute("UPDATE conversations SET title = ? WHERE id = ?", (title, conv_id)) > 0
+
+    def delete_conversation(self, conv_id: str) -> bool:
+        return self._execute("DELETE FROM conversations WHERE id = ?", (conv_id,)) > 0
+
+    # ------------------------------------------------------------------
+    # Analytics
+    # ------------------------------------------------------------------
+    def record_query(self, entry: Dict[str, Any]) -> None:
+        """Store a query entry, keeping only the newest MAX_ANALYTICS_ENTRIES plus running totals."""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = conn.execute("INSERT INTO analytics (data) VALUES (?)", (orjson.dumps(entry),))
+                conn.execute("DELETE FROM analytics WHERE id <= ?", (cur.lastrowid - MAX_ANALYTICS_ENTRIES,))
+                conn.execute(
+                    "UPDATE analytics_totals SET count = count + 1, total_ms = total_ms + ? WHERE id = 0",
+                    (entry["response_time_ms"],),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def analytics_totals(self) -> tuple[int, int]:
+        """Return ``(query_count, total_response_ms)`` over all queries ever recorded."""
+        row = self._query("SELECT count, total_ms FROM analytics_totals WHERE id = 0")[0]
+        return row["count"], row["total_ms"]
+
+    def recent_queries(self, limit: int = 10) -> List[dict]:
+        """Newest analytics entries first."""
+        rows = self._query("SELECT data FROM analytics ORDER BY id DESC LIMIT ?", (limit,))
+        return [orjson.loads(r["data"]) for r in rows]
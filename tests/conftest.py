@@ -0,0 +1,4 @@
+import os
+
+# backend.main opens the shared store at import time; keep it out of the working tree
+os.environ.setdefault("STORE_PATH", ":memory:")
@@ -0,0 +1,35 @@
+from backend.main import smart_chunk
+
+
+def test_empty_text_yields_no_chunks():
+    assert smart_chunk("") == []
+    assert smart_chunk("\n  \n") == []
+
+
+def test_boundary_carries_trailing_sentences_within_overlap():
+    text = "aaaaaaaa. bbbbbbbb. cccccccc. dddddddd."
+
+    assert smart_chunk(text, chunk_size=30, overlap=12) == [
+        "aaaaaaaa. bbbbbbbb. cccccccc.",
+        "cccccccc. dddddddd.",
+    ]
+
+
+def test_sentence_longer_than_overlap_carries_its_trailing_words():
+    text = "one two three four five six. seven eight nine ten eleven."
+
+    assert smart_chunk(text, chunk_size=40, overlap=10) == [
+        "one two three four five six.",
+        "five six. seven eight nine ten eleven.",
+    ]
+
+
+def test_chunks_stay_within_chunk_size_and_keep_every_sentence():
+    sentences = [f"Sentence number {i} has {'some ' * (i % 5)}words." for i in range(200)]
+    text = " ".join(sentences[:100]) + "\n\n" + " ".join(sentences[100:])
+
+    chunks = smart_chunk(text, chunk_size=150, overlap=60)
+
+    assert len(chunks) > 1
+    assert all(len(c) <= 150 for c in chunks)
+    assert {s for c in chunks for s in c.replace(". ", ".\n").split("\n")} == set(sentences)
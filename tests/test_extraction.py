@@ -0,0 +1,77 @@
+import fitz
+import pytest
+
+from backend import extraction
+from backend.extraction import extract_pdf_text, extract_text
+
+
+def make_pdf(pages):
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def extract_spy(monkeypatch):
+    """Record whether extraction went through the worker pool."""
+    calls = []
+    original = extraction._extract_parallel
+
+    def spy(data, page_count):
+        calls.append(page_count)
+        return original(data, page_count)
+
+    monkeypatch.setattr(extraction, "_extract_parallel", spy)
+    return calls
+
+
+# ------------------------------------------------------------------
+# Plain text
+# ------------------------------------------------------------------
+def test_txt_is_decoded_as_utf8_ignoring_bad_bytes():
+    assert extract_text("café\n".encode() + b"\xff", "notes.TXT") == "café\n"
+
+
+# ------------------------------------------------------------------
+# PDF
+# ------------------------------------------------------------------
+def test_small_pdf_is_extracted_serially(monkeypatch, extract_spy):
+    monkeypatch.setattr(extraction, "PDF_WORKERS", 2)
+    data = make_pdf(["first page", "second page"])
+
+    text = extract_text(data, "doc.pdf")
+
+    assert extract_spy == []
+    assert text.index("first page") < text.index("second page")
+
+
+def test_large_pdf_is_split_across_workers_in_page_order(monkeypatch, extract_spy):
+    monkeypatch.setattr(extraction, "PDF_WORKERS", 2)
+    monkeypatch.setattr(extraction, "PARALLEL_PDF_MIN_PAGES", 3)
+    pages = [f"page number {i}" for i in range(5)]
+    data = make_pdf(pages)
+
+    try:
+        parallel = extract_pdf_text(data)
+    finally:
+        extraction.shutdown_pool()
+    monkeypatch.setattr(extraction, "PDF_WORKERS", 1)
+    serial = extract_pdf_text(data)
+
+    assert extract_spy == [5]
+    assert parallel == serial
+    assert [parallel.index(p) for p in pages] == sorted(parallel.index(p) for p in pages)
+
+
+def test_falls_back_to_pypdf_when_pymupdf_fails(monkeypatch):
+    data = make_pdf(["rescued by pypdf"])
+
+    def broken_open(*args, **kwargs):
+        raise RuntimeError("cannot open document")
+
+    monkeypatch.setattr(extraction.fitz, "open", broken_open)
+
+    assert "rescued by pypdf" in extract_pdf_text(data)
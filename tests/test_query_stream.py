@@ -0,0 +1,64 @@
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.store import Store
+
+
+class StubService:
+    """Returns one hit and streams the given tokens, then raises *error* if set."""
+
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        self.error = error
+
+    def search(self, query, top_k):
+        return [{"id": "doc_0", "similarity": 0.9, "meta": {"content": "Endee is fast.", "filename": "a.txt"}}]
+
+    def generate_answer_stream(self, query, context_chunks, history):
+        yield from self.tokens
+        if self.error:
+            raise self.error
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = Store(str(tmp_path / "test.db"))
+    monkeypatch.setattr(main, "store", store)
+    return store
+
+
+def stream_events(service, monkeypatch):
+    """POST to /query/stream and return ``[(event, data), ...]`` in arrival order."""
+    monkeypatch.setattr(main.app.state, "rag_service", service, raising=False)
+    response = TestClient(main.app).post("/query/stream", json={"query": "What is Endee?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line.removeprefix("event: "), orjson.loads(data_line.removeprefix("data: "))))
+    return events
+
+
+def test_stream_sends_results_then_tokens_then_done(store, monkeypatch):
+    events = stream_events(StubService(["Endee ", "is ", "fast."]), monkeypatch)
+
+    assert [name for name, _ in events] == ["results", "token", "token", "token", "done"]
+    assert events[0][1][0]["content"] == "Endee is fast."
+    assert "".join(data for name, data in events if name == "token") == "Endee is fast."
+
+    conv = store.get_conversation(events[-1][1]["conversation_id"])
+    assert conv["messages"][-1] == {"role": "assistant", "content": "Endee is fast."}
+    assert store.analytics_totals()[0] == 1
+
+
+def test_interrupted_stream_sends_error_and_saves_no_exchange(store, monkeypatch):
+    events = stream_events(StubService(["Endee "], error=RuntimeError("quota")), monkeypatch)
+
+    assert [name for name, _ in events] == ["results", "token", "error"]
+    assert "quota" in events[-1][1]["detail"]
+    assert store.conversation_count() == 0
+    assert store.analytics_totals()[0] == 1
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from backend import rag as rag_module
+from backend.rag import RAGService
+
+
+class StubModel:
+    """Embeds a text as ``[len(text), 0, ...]`` and records every encode call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t)), 0.0, 0.0] for t in texts], dtype=np.float32)
+
+
+class StubIndex:
+    """Answers with the query vector's first component; shorter texts answer later."""
+
+    def query(self, vector, top_k):
+        time.sleep(0.02 / vector[0])
+        return [{"id": vector[0], "top_k": top_k}]
+
+
+@pytest.fixture
+def service():
+    # Skip __init__, which connects to Endee and loads the real model
+    svc = object.__new__(RAGService)
+    svc.model = StubModel()
+    svc.index = StubIndex()
+    svc._embed_cache = OrderedDict()
+    svc._embed_cache_lock = threading.Lock()
+    return svc
+
+
+# ------------------------------------------------------------------
+# Batched search
+# ------------------------------------------------------------------
+def test_search_batch_returns_results_in_query_order(service):
+    queries = ["a", "bbbb", "cc", "ddddddd"]
+
+    results = service.search_batch(queries, top_k=3)
+
+    assert results == [[{"id": float(len(q)), "top_k": 3}] for q in queries]
+    assert service.model.calls == [queries]
+
+
+def test_search_batch_with_no_queries_returns_empty_list(service):
+    assert service.search_batch([]) == []
+    assert service.model.calls == []
+
+
+# ------------------------------------------------------------------
+# Chunk embedding cache
+# ------------------------------------------------------------------
+def test_embed_texts_encodes_only_cache_misses(service):
+    first = service._embed_texts(["alpha", "be"])
+    second = service._embed_texts(["be", "gamma", "alpha"])
+
+    assert service.model.calls == [["alpha", "be"], ["gamma"]]
+    assert [v[0] for v in first] == [5.0, 2.0]
+    assert [v[0] for v in second] == [2.0, 5.0, 5.0]
+
+
+def test_embed_texts_fully_cached_batch_skips_encode(service):
+    service._embed_texts(["alpha", "be"])
+    service._embed_texts(["be", "alpha"])
+
+    assert service.model.calls == [["alpha", "be"]]
+
+
+def test_embed_cache_evicts_least_recently_used(service, monkeypatch):
+    monkeypatch.setattr(rag_module, "EMBED_CACHE_SIZE", 2)
+    service._embed_texts(["a", "b"])
+    service._embed_texts(["a"])  # "b" is now the least recently used
+    service._embed_texts(["c"])
+    service.model.calls.clear()
+
+    service._embed_texts(["a", "c", "b"])
+
+    assert service.model.calls == [["b"]]
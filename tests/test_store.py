@@ -0,0 +1,135 @@
+import itertools
+
+import pytest
+
+from backend import store as store_module
+from backend.store import Store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return Store(str(tmp_path / "test.db"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing timestamps, so updated_at ordering never ties."""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(store_module.time, "time", lambda: float(next(ticks)))
+
+
+# ------------------------------------------------------------------
+# Documents
+# ------------------------------------------------------------------
+def test_documents_round_trip(store):
+    store.put_document({"filename": "a.pdf", "chunks": 3, "preview": "é"})
+    store.put_document({"filename": "b.txt", "chunks": 4})
+
+    assert store.get_document("a.pdf") == {"filename": "a.pdf", "chunks": 3, "preview": "é"}
+    assert [d["filename"] for d in store.list_documents()] == ["a.pdf", "b.txt"]
+    assert store.document_stats() == (2, 7)
+
+    assert store.delete_document("a.pdf")
+    assert not store.delete_document("a.pdf")
+    assert store.get_document("a.pdf") is None
+    assert store.document_stats() == (1, 4)
+
+
+def test_put_document_replaces_existing(store):
+    store.put_document({"filename": "a.pdf", "chunks": 3})
+    store.put_document({"filename": "a.pdf", "chunks": 5})
+
+    assert store.document_stats() == (1, 5)
+
+
+# ------------------------------------------------------------------
+# Conversations
+# ------------------------------------------------------------------
+def test_append_exchange_creates_then_appends(store):
+    store.append_exchange("c1", "First title", "q1", "a1")
+    store.append_exchange("c1", "ignored", "q2", "a2")
+
+    conv = store.get_conversation("c1")
+    assert conv["title"] == "First title"
+    assert conv["messages"] == [
+        {"role": "user", "content": "q1"},
+        {"role": "assistant", "content": "a1"},
+        {"role": "user", "content": "q2"},
+        {"role": "assistant", "content": "a2"},
+    ]
+    assert store.list_conversations()[0]["message_count"] == 4
+
+
+def test_recent_messages_returns_last_n_in_order(store):
+    for i in range(4):
+        store.append_exchange("c1", "t", f"q{i}", f"a{i}")
+
+    assert [m["content"] for m in store.recent_messages("c1", limit=3)] == ["a2", "q3", "a3"]
+    assert store.recent_messages("missing", limit=3) == []
+
+
+def test_list_conversations_most_recently_updated_first(store, clock):
+    store.append_exchange("old", "t", "q", "a")
+    store.append_exchange("new", "t", "q", "a")
+    store.append_exchange("old", "t", "q", "a")
+
+    assert [c["id"] for c in store.list_conversations()] == ["old", "new"]
+
+
+def test_eviction_drops_least_recently_updated_and_cascades(store, clock, monkeypatch):
+    monkeypatch.setattr(store_module, "MAX_CONVERSATIONS", 2)
+    store.append_exchange("c1", "t", "q", "a")
+    store.append_exchange("c2", "t", "q", "a")
+    store.append_exchange("c1", "t", "q", "a")  # c2 is now the least recently updated
+    store.append_exchange("c3", "t", "q", "a")
+
+    assert {c["id"] for c in store.list_conversations()} == {"c1", "c3"}
+    assert store.get_conversation("c2") is None
+    assert store._query("SELECT COUNT(*) FROM messages WHERE conv_id = 'c2'")[0][0] == 0
+
+
+def test_rename_and_delete_conversation(store):
+    store.append_exchange("c1", "t", "q", "a")
+
+    assert store.rename_conversation("c1", "Renamed")
+    assert store.get_conversation("c1")["title"] == "Renamed"
+    assert not store.rename_conversation("missing", "x")
+
+    assert store.delete_conversation("c1")
+    assert not store.delete_conversation("c1")
+    assert store.conversation_count() == 0
+    assert store._query("SELECT COUNT(*) FROM messages")[0][0] == 0
+
+
+def test_conversation_markdown_accumulates_and_follows_rename(store):
+    store.append_exchange("c1", "t", "q1", "a1")
+    store.append_exchange("c1", "t", "q2", "a2")
+    store.rename_conversation("c1", "Renamed")
+
+    title, markdown = store.get_conversation_markdown("c1")
+    assert title == "Renamed"
+    assert markdown == (
+        "\n**You**:\n\nq1\n\n---\n"
+        "\n**Endee Assistant**:\n\na1\n\n---\n"
+        "\n**You**:\n\nq2\n\n---\n"
+        "\n**Endee Assistant**:\n\na2\n\n---\n"
+    )
+    assert store.get_conversation_markdown("missing") is None
+
+
+# ------------------------------------------------------------------
+# Analytics
+# ------------------------------------------------------------------
+def test_analytics_totals_span_beyond_retained_window(store, monkeypatch):
+    monkeypatch.setattr(store_module, "MAX_ANALYTICS_ENTRIES", 3)
+    for i in range(5):
+        store.record_query({"query": f"q{i}", "response_time_ms": 10 * (i + 1)})
+
+    assert store.analytics_totals() == (5, 150)
+    assert [q["query"] for q in store.recent_queries(10)] == ["q4", "q3", "q2"]
+    assert store._query("SELECT COUNT(*) FROM analytics")[0][0] == 3
+
+
+def test_analytics_totals_start_at_zero(store):
+    assert store.analytics_totals() == (0, 0)
+    assert store.recent_queries() == []